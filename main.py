@@ -17,21 +17,28 @@ limitations under the License.
 """
 
 import sys
-import urllib.request
+import functools
 import gzip
+import io
 import os
 import json
+import pickle
+import re
+import shutil
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+from requests.adapters import HTTPAdapter
 
-class Conf:
-    def __init__(self, file):
-        self.data = json.load(file)
+# rapidgzip spreads deflate block decoding across a thread pool; fall back
+# to the single-threaded stdlib decoder when it is not installed.
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
 
-    def __getattr__(self, attr: str):
-        return self.data[attr]
-
-
-config: Conf
 
 dotconf: str = (
     os.environ["XDG_CONFIG_HOME"]
@@ -48,11 +55,11 @@ dotcache: str = (
 conffolder = os.path.join(dotconf, "debdl")
 conffile = os.path.join(conffolder, "config.json")
 
-if not os.path.isdir(conffolder):
-    os.mkdir(conffolder)
+os.makedirs(conffolder, exist_ok=True)
 
-if not os.path.exists(conffile):
-    with open(conffile, "w") as fw:
+try:
+    # Exclusive mode probes for and creates the default config in one step
+    with open(conffile, "x") as fw:
         json.dump(
             {
                 "mirror": "http://ftp.debian.org/debian",
@@ -62,23 +69,180 @@ if not os.path.exists(conffile):
             },
             fw,
         )
+except FileExistsError:
+    pass
 
+# Config fields are bound as plain module constants: every URL built during
+# resolution reads them, and attribute indirection per access adds up.
 with open(conffile, "r") as f:
-    config = Conf(f)
+    _conf = json.load(f)
+
+MIRROR = _conf["mirror"]
+DIST = _conf["dist"]
+COMPONENT = _conf["component"]
+ARCHITECTURE = _conf["architecture"]
 
 # URL to the Packages file for the specified distribution, component, and architecture
-PACKAGES_URL = f"{config.mirror}/dists/{config.dist}/{config.component}/{config.architecture}/Packages.gz"
+PACKAGES_URL = f"{MIRROR}/dists/{DIST}/{COMPONENT}/{ARCHITECTURE}/Packages.gz"
 LOCAL_PACKAGES_FILE = f"{dotcache}/Packages.gz"
+# Sidecar storing the ETag/Last-Modified of the cached Packages.gz so reruns
+# can revalidate it with a conditional GET instead of trusting it forever.
+PACKAGES_META_FILE = LOCAL_PACKAGES_FILE + ".meta.json"
+# Pickled parse result of Packages.gz, plus a sidecar recording which
+# Packages.gz (by mtime and size) it was built from.
+PACKAGES_INDEX_FILE = f"{dotcache}/Packages.pkl"
+PACKAGES_INDEX_META_FILE = PACKAGES_INDEX_FILE + ".meta.json"
 INSTALL_SCRIPT = "install.sh"
 
+INSTALL_SCRIPT_HEADER = """\
+#!/bin/bash
+set -e
+
+echo 'Starting installation of downloaded .deb packages...'
+
+"""
+
+INSTALL_SCRIPT_FOOTER = """\
+echo 'Fixing dependencies, if any...'
+sudo apt-get install -f -y
+echo 'Installation complete.'
+"""
+
+# Copy downloads in 1 MB chunks straight to an unbuffered file: large .debs
+# then cost one read and one write syscall per megabyte instead of per 8 KB.
+DOWNLOAD_CHUNK = 1 << 20
+
+# Shared keep-alive session: every .deb comes from the same mirror, so one
+# pooled connection set amortizes the TCP/TLS handshake across all fetches.
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
 
 def download_packages_file():
-    """Download the Packages.gz file if not already cached."""
-    if not os.path.exists(LOCAL_PACKAGES_FILE):
+    """
+    Download the Packages.gz file, revalidating any cached copy against the
+    mirror with a conditional GET. A 304 means the cache is still current and
+    nothing is transferred; a 200 refreshes both the cache and its metadata.
+    """
+    headers = {}
+    if os.path.exists(LOCAL_PACKAGES_FILE) and os.path.exists(PACKAGES_META_FILE):
+        with open(PACKAGES_META_FILE, "r") as fm:
+            meta = json.load(fm)
+        if "etag" in meta:
+            headers["If-None-Match"] = meta["etag"]
+        if "last_modified" in meta:
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        response = session.get(PACKAGES_URL, headers=headers, stream=True)
+    except requests.RequestException as e:
+        # An unreachable mirror must not kill runs that can work offline
+        if os.path.exists(LOCAL_PACKAGES_FILE):
+            print(f"Warning: could not reach mirror ({e}), using cached Packages.gz")
+            return
+        raise
+    with response:
+        if response.status_code == 304:
+            print("Using cached Packages.gz (mirror unchanged)")
+            return
+        response.raise_for_status()
         print("Downloading Packages.gz ...")
-        urllib.request.urlretrieve(PACKAGES_URL, LOCAL_PACKAGES_FILE)
-    else:
-        print("Using cached Packages.gz")
+        with open(LOCAL_PACKAGES_FILE, "wb", buffering=0) as out:
+            shutil.copyfileobj(response.raw, out, length=DOWNLOAD_CHUNK)
+        meta = {}
+        if "ETag" in response.headers:
+            meta["etag"] = response.headers["ETag"]
+        if "Last-Modified" in response.headers:
+            meta["last_modified"] = response.headers["Last-Modified"]
+        with open(PACKAGES_META_FILE, "w") as fw:
+            json.dump(meta, fw)
+
+
+# Bump whenever the shape of the parsed index changes, so stale pickles
+# written by older versions are discarded instead of loaded.
+INDEX_FORMAT = 3
+
+
+def packages_file_tag():
+    """Return the identity of the cached Packages.gz plus the index format."""
+    st = os.stat(LOCAL_PACKAGES_FILE)
+    return {"mtime": st.st_mtime, "size": st.st_size, "format": INDEX_FORMAT}
+
+
+def load_cached_index():
+    """
+    Return the pickled package index if it was built from the current
+    Packages.gz, or None when it is missing or stale.
+    """
+    try:
+        with open(PACKAGES_INDEX_META_FILE, "r") as fm:
+            if json.load(fm) != packages_file_tag():
+                return None
+        with open(PACKAGES_INDEX_FILE, "rb") as fp:
+            return pickle.load(fp)
+    except (OSError, json.JSONDecodeError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def store_cached_index(packages):
+    """Pickle the parsed package index and tag it with the Packages.gz stat."""
+    with open(PACKAGES_INDEX_FILE, "wb") as fp:
+        pickle.dump(packages, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(PACKAGES_INDEX_META_FILE, "w") as fm:
+        json.dump(packages_file_tag(), fm)
+
+
+def verify_packages_file():
+    """
+    Check the cached Packages.gz against the CRC32 and length stored in its
+    gzip trailer, catching truncated or corrupted downloads without touching
+    the network. zlib.crc32 is hardware-accelerated on common platforms, so
+    the check runs at decompression speed.
+    """
+    try:
+        with open(LOCAL_PACKAGES_FILE, "rb") as raw:
+            raw.seek(-8, os.SEEK_END)
+            trailer = raw.read(8)
+        if len(trailer) != 8:
+            return False
+        want_crc = int.from_bytes(trailer[:4], "little")
+        want_size = int.from_bytes(trailer[4:], "little")
+        crc = 0
+        size = 0
+        with gzip.open(LOCAL_PACKAGES_FILE, "rb") as f:
+            # 1 MB chunks keep the CRC loop in cache without many read calls
+            while chunk := f.read(1 << 20):
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+        return crc == want_crc and size & 0xFFFFFFFF == want_size
+    except (OSError, EOFError, gzip.BadGzipFile, zlib.error):
+        return False
+
+
+def open_packages_file():
+    """
+    Open the cached Packages.gz as a text stream, decompressing on all cores
+    when rapidgzip is available.
+    """
+    if rapidgzip is not None:
+        raw = rapidgzip.open(LOCAL_PACKAGES_FILE, parallelization=os.cpu_count())
+        return io.TextIOWrapper(raw, encoding="utf-8", errors="ignore")
+    return gzip.open(LOCAL_PACKAGES_FILE, "rt", encoding="utf-8", errors="ignore")
+
+
+def _flush_entry(pkg_info, packages):
+    """Post-process a finished entry and insert it into the packages dict."""
+    if "Package" not in pkg_info:
+        return
+    if "Depends" in pkg_info:
+        pkg_info["Depends"] = parse_dependencies(pkg_info["Depends"])
+    if "Filename" in pkg_info:
+        # Filename is always a POSIX path from the mirror; slicing it here
+        # saves an os.path.basename call per package in the download loops
+        pkg_info["_basename"] = pkg_info["Filename"].rsplit("/", 1)[-1]
+    # Interned names make every later dict/set probe an identity compare
+    packages[sys.intern(pkg_info["Package"])] = pkg_info
 
 
 def parse_packages_file():
@@ -87,76 +251,175 @@ def parse_packages_file():
     package names to their metadata.
     """
     packages = {}
-    with gzip.open(LOCAL_PACKAGES_FILE, "rt", encoding="utf-8", errors="ignore") as f:
-        content = f.read()
-    entries = content.split("\n\n")
-    for entry in entries:
-        if not entry.strip():
-            continue
-        pkg_info = {}
-        lines = entry.splitlines()
-        key = None
-        for line in lines:
-            # Handle line continuations
-            if line.startswith(" "):
+    pkg_info = {}
+    key = None
+    # Stream line by line so entries are flushed as they are decompressed,
+    # instead of materializing the whole decompressed file as one string.
+    with open_packages_file() as f:
+        for line in f:
+            if line == "\n":
+                # Blank line terminates the current entry
+                _flush_entry(pkg_info, packages)
+                pkg_info = {}
+                key = None
+            elif line[0] == " ":
+                # Handle line continuations
                 if key:
                     pkg_info[key] += " " + line.strip()
-            elif ":" in line:
-                key, value = line.split(":", 1)
-                key = key.strip()
-                value = value.strip()
-                pkg_info[key] = value
-        if "Package" in pkg_info:
-            packages[pkg_info["Package"]] = pkg_info
+            else:
+                # One scan instead of an "in" probe plus a split, and field
+                # names never carry whitespace so only the value is stripped.
+                # Colon-less lines are ignored without touching key, so a
+                # following continuation still attaches to the last field.
+                k, sep, value = line.partition(":")
+                if sep:
+                    key = k
+                    pkg_info[key] = value.strip()
+    # Flush the final entry if the file does not end with a blank line
+    _flush_entry(pkg_info, packages)
+    # The memo is only useful while entries stream in; release it here
+    parse_dependencies.cache_clear()
     return packages
 
 
+# Matches the package name leading a dependency alternative; bound as .match
+# so each name is extracted in one C-level scan that naturally stops before
+# version constraints or architecture qualifiers.
+_DEP_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9+\-.]*").match
+
+
+# Auto-generated packages often share identical Depends lines verbatim, so
+# memoizing on the raw string skips re-parsing them; the cache is cleared
+# once parsing finishes. The tuple result is immutable and safe to share.
+@functools.lru_cache(maxsize=None)
 def parse_dependencies(dep_str):
     """
-    Given a dependency string from the Packages file, return a list of package names.
+    Given a dependency string from the Packages file, return a tuple of package names.
     For example, a string like:
       "libc6 (>= 2.29), libgcc1 (>= 1:3.0) | libgcc-s1"
-    will yield ['libc6', 'libgcc1'].
+    will yield ('libc6', 'libgcc1').
     This function splits on commas and for alternatives (separated by '|') chooses the first.
     """
     deps = []
     for dep in dep_str.split(","):
-        dep = dep.strip()
-        if not dep:
-            continue
-        # Split alternatives (if any) and choose the first
-        alternatives = dep.split("|")
-        first_alt = alternatives[0].strip()
-        # Remove any version constraints (anything in parentheses)
-        pkg = first_alt.split(" ")[0]
-        deps.append(pkg)
-    return deps
+        match = _DEP_NAME(dep.split("|", 1)[0].lstrip())
+        if match:
+            # A dep like libc6 recurs across thousands of packages; interning
+            # collapses the copies into one shared string object
+            deps.append(sys.intern(match.group()))
+    return tuple(deps)
 
 
-def resolve_dependencies(package_name, packages, resolved=None, seen=None):
+class DepGraph:
     """
-    Recursively resolve dependencies for a given package.
-    Returns a set of package names that includes the package and all its dependencies.
+    Structure-of-arrays view of the dependency graph. Packages are numbered
+    in index insertion order and edges live in a CSR pair (indptr/indices) of
+    flat int arrays, so the traversal walks contiguous memory instead of
+    chasing dict pointers. Names referenced in Depends but absent from the
+    index become trailing virtual nodes with no edges, marked 0 in `present`.
     """
-    if resolved is None:
-        resolved = set()
-    if seen is None:
-        seen = set()
-    if package_name in resolved:
-        return resolved
-    if package_name in seen:
-        return resolved
-    seen.add(package_name)
-    if package_name not in packages:
+
+    def __init__(self, packages):
+        names = list(packages)
+        name_to_idx = {name: i for i, name in enumerate(names)}
+        indptr = array("i", [0])
+        indices = array("i")
+        for info in packages.values():
+            for dep in info.get("Depends", ()):
+                idx = name_to_idx.get(dep)
+                if idx is None:
+                    idx = len(names)
+                    name_to_idx[dep] = idx
+                    names.append(dep)
+                indices.append(idx)
+            indptr.append(len(indices))
+        # Virtual nodes carry no edges of their own
+        indptr.extend([len(indices)] * (len(names) - len(packages)))
+        self.names = names
+        self.name_to_idx = name_to_idx
+        self.indptr = indptr
+        self.indices = indices
+        self.present = bytearray(len(names))
+        self.present[: len(packages)] = b"\x01" * len(packages)
+        # Transitive closures in install order (tuples of ids, dependencies
+        # first), memoized per node so several CLI targets that share a
+        # subtree (e.g. anything depending on libc6) only walk it once.
+        self.closure_cache = {}
+
+
+def resolve_and_order(package_name, graph):
+    """
+    Collect the transitive dependency closure of a package and return it as a
+    list of names in installation order (dependencies before dependents).
+    Post-order DFS finish time is already a topological order, so one
+    traversal replaces the separate resolve and topo-sort passes. Finished
+    subtrees are memoized on the graph and reused across calls.
+    """
+    root = graph.name_to_idx.get(package_name)
+    if root is None:
         print(f"Warning: {package_name} not found in package list")
-        return resolved
-    pkg_info = packages[package_name]
-    if "Depends" in pkg_info:
-        dep_list = parse_dependencies(pkg_info["Depends"])
-        for dep in dep_list:
-            resolve_dependencies(dep, packages, resolved, seen)
-    resolved.add(package_name)
-    return resolved
+        return []
+    cache = graph.closure_cache
+    cached = cache.get(root)
+    if cached is not None:
+        return [graph.names[i] for i in cached]
+    indptr = graph.indptr
+    indices = graph.indices
+    present = graph.present
+    order = []
+    # Bitmaps indexed by package id: a byte test replaces hashing the id on
+    # every membership check in the inner loop.
+    emitted = bytearray(len(graph.names))
+    seen = bytearray(len(graph.names))
+    stack = [(root, False)]
+    while stack:
+        pkg, finished = stack.pop()
+        if finished:
+            # All children are done, so every dependency is already in order.
+            order.append(pkg)
+            emitted[pkg] = 1
+            # Memoize this subtree's closure. Virtual deps contribute
+            # nothing, and a dep on a cycle has no cache entry yet, which
+            # leaves this node unmemoized.
+            sub = []
+            sub_emitted = set()
+            complete = True
+            for dep in indices[indptr[pkg] : indptr[pkg + 1]]:
+                if not present[dep]:
+                    continue
+                dep_closure = cache.get(dep)
+                if dep_closure is None:
+                    complete = False
+                    break
+                for node in dep_closure:
+                    if node not in sub_emitted:
+                        sub_emitted.add(node)
+                        sub.append(node)
+            if complete:
+                sub.append(pkg)
+                cache[pkg] = tuple(sub)
+            continue
+        if seen[pkg]:
+            continue
+        seen[pkg] = 1
+        cached = cache.get(pkg)
+        if cached is not None:
+            # Splice a memoized subtree in; it is internally ordered and all
+            # of it precedes whatever is still unfinished on the stack.
+            for node in cached:
+                seen[node] = 1
+                if not emitted[node]:
+                    emitted[node] = 1
+                    order.append(node)
+            continue
+        if not present[pkg]:
+            print(f"Warning: {graph.names[pkg]} not found in package list")
+            continue
+        stack.append((pkg, True))
+        for dep in indices[indptr[pkg] : indptr[pkg + 1]]:
+            if not seen[dep]:
+                stack.append((dep, False))
+    return [graph.names[i] for i in order]
 
 
 def download_deb(package_name, packages, output_dir):
@@ -170,88 +433,61 @@ def download_deb(package_name, packages, output_dir):
     if "Filename" not in pkg_info:
         print(f"No Filename info for package {package_name}")
         return
-    deb_url = f"{config.mirror}/{pkg_info['Filename']}"
-    os.makedirs(output_dir, exist_ok=True)
-    deb_path = os.path.join(output_dir, os.path.basename(pkg_info["Filename"]))
+    deb_url = f"{MIRROR}/{pkg_info['Filename']}"
+    deb_path = output_dir + "/" + pkg_info["_basename"]
     if os.path.exists(deb_path):
         print(f"{deb_path} already exists, skipping download.")
         return
     print(f"Downloading {package_name} from {deb_url}")
     try:
-        urllib.request.urlretrieve(deb_url, deb_path)
+        with session.get(deb_url, stream=True) as response:
+            response.raise_for_status()
+            with open(deb_path, "wb", buffering=0) as out:
+                shutil.copyfileobj(response.raw, out, length=DOWNLOAD_CHUNK)
     except Exception as e:
         print(f"Error downloading {package_name}: {e}")
 
 
-def compute_install_order(resolved, packages):
-    """
-    Compute an installation order (list) so that dependencies are installed before
-    dependents. This function performs a DFS topological sort on the resolved set.
-    """
-    order = []
-    visited = set()
-
-    def dfs(pkg):
-        if pkg in visited:
-            return
-        visited.add(pkg)
-        if pkg in packages and "Depends" in packages[pkg]:
-            for dep in parse_dependencies(packages[pkg]["Depends"]):
-                if dep in resolved:
-                    dfs(dep)
-        order.append(pkg)
-
-    # Process each package in the resolved set.
-    for pkg in resolved:
-        if pkg not in visited:
-            dfs(pkg)
-    return order
-
-
 def generate_install_script(
-    install_order, packages, output_dir, script_name=INSTALL_SCRIPT
+    install_order, packages, output_dir, script_name=INSTALL_SCRIPT, classic=False
 ):
     """
-    Generate a shell script that installs the .deb files in the given order.
+    Generate a shell script that installs the downloaded .deb files.
     The script assumes that the .deb files are located in output_dir.
+    By default apt gets every .deb in one invocation and works out the
+    ordering itself; classic=True emits one install line per package in
+    dependency order instead.
     """
-    lines = [
-        "#!/bin/bash",
-        "set -e",  # Stop on error
-        "",
-        "echo 'Starting installation of downloaded .deb packages...'",
-        "",
-    ]
-    for pkg in install_order:
-        if pkg not in packages or "Filename" not in packages[pkg]:
-            continue
-        deb_file = os.path.basename(packages[pkg]["Filename"])
-        deb_path = os.path.join(output_dir, deb_file)
-        # Add a line to install this deb package
-        lines.append(f"echo 'Installing {pkg}...'")
-        lines.append(f"sudo apt install ./{deb_path} || true")
-        lines.append("")
+    parts = [INSTALL_SCRIPT_HEADER]
+    if classic:
+        for pkg in install_order:
+            if pkg not in packages or "Filename" not in packages[pkg]:
+                continue
+            deb_path = output_dir + "/" + packages[pkg]["_basename"]
+            # One preformatted block per package, joined in a single write
+            parts.append(
+                f"echo 'Installing {pkg}...'\nsudo apt install ./{deb_path} || true\n\n"
+            )
+    else:
+        parts.append(f"sudo apt install ./{output_dir}/*.deb || true\n\n")
     # Optionally, fix any dependency issues at the end.
-    lines.append("echo 'Fixing dependencies, if any...'")
-    lines.append("sudo apt-get install -f -y")
-    lines.append("echo 'Installation complete.'")
-
-    script_content = "\n".join(lines)
+    parts.append(INSTALL_SCRIPT_FOOTER)
     with open(script_name, "w") as f:
-        f.write(script_content)
+        f.write("".join(parts))
     os.chmod(script_name, 0o755)
     print(f"Installation script generated: {script_name}")
 
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: debdl [-h --help] PACKAGES...\n")
+        print("Usage: debdl [-h --help] [--classic] PACKAGES...\n")
         sys.exit(1)
 
     if sys.argv[1] == "--help" or sys.argv[1] == "-h":
-        print("Usage: debdl [-h --help] PACKAGES...\n")
+        print("Usage: debdl [-h --help] [--classic] PACKAGES...\n")
         print(
             "  --help -h\tShows this message",
+            "  --classic\tGenerate an install script with one apt call per package in dependency order",
             "\tChanging architecture output\n"
             f'To change architectures edit "{conffile}" and change the value of "architecture" to any of the list below:',
             " - binary-all\n - binary-amd64\n - binary-arm64\n - binary-armel\n - binary-armf\n - binary-i386\n - binary-mips64el\n - binary-mipsel\n - binary-ppc64el\n - binary-s390x\n",
@@ -263,25 +499,51 @@ def main():
         sys.exit(1)
 
     target_packages = sys.argv[1:]
+    classic = "--classic" in target_packages
+    if classic:
+        target_packages = [arg for arg in target_packages if arg != "--classic"]
+    if not target_packages:
+        print("Usage: debdl [-h --help] [--classic] PACKAGES...\n")
+        sys.exit(1)
 
-    print(f"NOTE: INSTALLING FROM {config.architecture} FOR MORE INFO RUN debdl --help")
+    print(f"NOTE: INSTALLING FROM {ARCHITECTURE} FOR MORE INFO RUN debdl --help")
 
     download_packages_file()
-    packages = parse_packages_file()
+    packages = load_cached_index()
+    if packages is None:
+        # Only pay for the integrity check when the file is actually about
+        # to be parsed; warm runs load the pickled index and skip it.
+        if not verify_packages_file():
+            print("Cached Packages.gz failed integrity check, re-downloading ...")
+            try:
+                os.remove(PACKAGES_META_FILE)
+            except OSError:
+                pass
+            download_packages_file()
+        packages = parse_packages_file()
+        store_cached_index(packages)
+    graph = DepGraph(packages)
 
     for package in target_packages:
         print("Resolving dependencies...")
-        resolved = resolve_dependencies(package, packages)
+        install_order = resolve_and_order(package, graph)
+        resolved = set(install_order)
 
         if resolved:
             print("Packages to download:")
-            for pkg in resolved:
+            for pkg in sorted(resolved):
                 print(f" - {pkg}")
 
-            for pkg in resolved:
-                download_deb(pkg, packages, package)
+            # Downloads are I/O-bound, so fetch them concurrently over the
+            # shared session instead of paying one round trip per package.
+            os.makedirs(package, exist_ok=True)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(
+                    executor.map(
+                        lambda pkg: download_deb(pkg, packages, package), resolved
+                    )
+                )
 
-            install_order = compute_install_order(resolved, packages)
             print("Installation order:")
             for pkg in install_order:
                 print(f" - {pkg}")
@@ -291,6 +553,7 @@ def main():
                 packages,
                 package,
                 package + "/" + INSTALL_SCRIPT,
+                classic,
             )
 
 